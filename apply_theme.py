@@ -4,23 +4,307 @@ OpenBench Theme Manager
 Apply custom color themes to OpenBench installation
 """
 
+import hashlib
 import json
 import os
 import sys
 import argparse
+import functools
+import itertools
 import shutil
 import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # Optional; falls back to the json module
+
+
+_SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# CSS files in OpenBench/static that are backed up and restored
+_CSS_FILES = ('style.css', 'form.css', 'paging.css', 'base.css')
+
+# Files present in an OpenBench root directory, cheapest to rule out first
+_OPENBENCH_MARKERS = (
+    'manage.py',
+    os.path.join('OpenBench', 'static', 'style.css'),
+    os.path.join('Templates', 'OpenBench'),
+)
+
+_HEX_COLOR = r'#[0-9A-Fa-f]{6}'
+
+# A complete #RRGGBB color, not the start of a longer hex run (e.g. #RRGGBBAA)
+_HEX_COLOR_RE = re.compile(_HEX_COLOR + r'(?![0-9A-Fa-f])')
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+
+_STATIC_VERSION_RE = re.compile(r"OPENBENCH_STATIC_VERSION = '([^']+)'")
+
+# First line of style.css, recording the colors of the last applied theme
+_THEME_HASH_PREFIX = '/* theme-hash: '
+_THEME_HASH_MARKER = _THEME_HASH_PREFIX + '{} */\n'
+
+# Part of the theme hash; bump when the way colors are rewritten changes so
+# stylesheets themed by an older version of this script are redone
+_THEME_HASH_VERSION = 1
+
+# Colors set directly on CSS rules:
+# (group name, theme section, theme key, selector, pattern between selector and color)
+# The selector is literal text; it also serves as a cheap check for whether the
+# rule appears in the stylesheet at all.
+_CSS_RULES = [
+    # Link colors (match the a: pseudo-class block)
+    ('link', 'links', 'default',
+     'a:link', r',\s*a:visited,\s*a:hover,\s*a:active\s*\{[^}]*color:\s*'),
+    # Sidebar hover
+    ('sidebar_hover', 'ui_elements', 'sidebar_hover',
+     '#sidebar li:hover', r'\s*\{[^}]*background-color:\s*'),
+    # Table headers - multiple patterns to catch them all
+    ('stripes_th', 'ui_elements', 'table_header_bg',
+     '.stripes th', r'\s*\{[^}]*background-color:\s*'),
+    ('table_header_th', 'ui_elements', 'table_header_bg',
+     '.table-header th', r'\s*\{[^}]*background-color:\s*'),
+    ('table_small_header_th', 'ui_elements', 'table_header_bg',
+     '.table-small-header th', r'\s*\{[^}]*background-color:\s*'),
+    ('table_spacer_small_th', 'ui_elements', 'table_header_bg',
+     '.table-spacer-small th', r'[^}]*background-color:\s*'),
+    # Table borders
+    ('table_border', 'ui_elements', 'table_border',
+     '#content td', r'\s*\{[^}]*border-bottom:[^;}]*?'),
+    # Hover rows - need to match both odd and even
+    ('hover_row_odd', 'ui_elements', 'hover_row',
+     '.hoverable tr:nth-child(odd):hover', r'[^}]*background-color:\s*'),
+    ('hover_row_even', 'ui_elements', 'hover_row',
+     '.hoverable tr:nth-child(even):hover', r'[^}]*background-color:\s*'),
+    # Engine options popup
+    ('popup_bg', 'ui_elements', 'popup_bg',
+     '.engine-options-popup', r'\s*\{[^}]*background-color:\s*'),
+    ('popup_border', 'ui_elements', 'popup_border',
+     '.engine-options-popup', r'\s*\{[^}]*border:[^;}]*?'),
+]
+
+# Button colors, plus their hover states
+_BUTTONS = [
+    ('btn-blue', 'btn_blue'),
+    ('btn-start', 'btn_start'),
+    ('btn-preset', 'btn_preset'),
+    ('btn-yellow', 'btn_yellow'),
+    ('btn-red', 'btn_red'),
+]
+_CSS_RULES += [
+    (color_key + suffix, 'buttons', color_key + suffix,
+     f'.{btn_class}{state}', r'\s*\{[^}]*background-color:\s*')
+    for btn_class, color_key in _BUTTONS
+    for state, suffix in [('', ''), (':hover', '_hover')]
+]
+
+
+def _compile_rule_passes(rules):
+    """Combine CSS rules into as few alternation patterns as possible.
+    
+    Each pattern replaces its rules in a single scan of the stylesheet. A match
+    consumes its selector's block up to the color, so rules sharing a selector
+    are spread across successive passes. Returns (pattern, selectors) pairs.
+    """
+    passes = []
+    for rule in rules:
+        for rule_pass in passes:
+            if all(other[3] != rule[3] for other in rule_pass):
+                rule_pass.append(rule)
+                break
+        else:
+            passes.append([rule])
+    
+    return [
+        (
+            re.compile('|'.join(
+                f'(?P<{name}>{re.escape(selector)}{between}){_HEX_COLOR}'
+                for name, _, _, selector, between in rule_pass
+            )),
+            tuple(rule[3] for rule in rule_pass),
+        )
+        for rule_pass in passes
+    ]
+
+
+_RULE_PASSES = _compile_rule_passes(_CSS_RULES)
+
+
+def _rewrite_root_vars(css, css_vars):
+    """Set CSS custom properties (e.g. ``--color1``) declared in :root blocks.
+    
+    Only a value starting with a #RRGGBB color is changed, and only that color;
+    anything after it (e.g. ``!important``) is kept. Variables that already
+    have the requested color are left untouched.
+    """
+    # Blank out comments, keeping offsets, so they can't hide declarations
+    masked = css
+    if '/*' in css:
+        masked = _CSS_COMMENT_RE.sub(lambda m: ' ' * len(m.group()), css)
+    
+    parts = []
+    cursor = 0
+    root = masked.find(':root')
+    while root >= 0:
+        start = masked.find('{', root) + 1
+        end = masked.find('}', start)
+        if start == 0 or end < 0:
+            break
+        
+        offset = start
+        for declaration in masked[start:end].split(';'):
+            name, sep, _ = declaration.partition(':')
+            var_name = name.strip()
+            if sep and var_name.startswith('--') and var_name[2:] in css_vars:
+                colon = offset + len(name)
+                value = css[colon + 1:offset + len(declaration)]
+                match = _HEX_COLOR_RE.match(value.lstrip())
+                color = css_vars[var_name[2:]]
+                if match and match.group().lower() != color.lower():
+                    parts.append(css[cursor:colon])
+                    parts.append(f': {color}')
+                    cursor = colon + 1 + len(value) - len(value.lstrip()) + match.end()
+            offset += len(declaration) + 1
+        root = masked.find(':root', end)
+    
+    if not parts:
+        return css
+    parts.append(css[cursor:])
+    return ''.join(parts)
+
+
+def _replace_rule_colors(css, pattern, rule_colors):
+    """Replace the color at the end of every match of a rule pass pattern.
+    
+    Matches that already have the requested color are left untouched.
+    """
+    parts = []
+    cursor = 0
+    for match in pattern.finditer(css):
+        name = match.lastgroup
+        color = rule_colors[name]
+        if css[match.end(name):match.end()].lower() == color.lower():
+            continue
+        parts.append(css[cursor:match.end(name)])
+        parts.append(color)
+        cursor = match.end()
+    if not parts:
+        return css
+    parts.append(css[cursor:])
+    return ''.join(parts)
+
+
+def _copy_files(pairs):
+    """Copy (src, dst) file pairs concurrently, preserving metadata."""
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda pair: shutil.copy2(*pair), pairs))
+
+
+def _write_atomic(path, *chunks):
+    """Write a file through a temporary file so it is never left half-written."""
+    # Replace the symlink target, not the symlink itself
+    path = os.path.realpath(path)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@functools.lru_cache(maxsize=256)
+def _load_theme(path, mtime_ns):
+    """Load a theme JSON file; the mtime in the cache key drops stale entries."""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _theme_digest(theme):
+    """Hash the theme colors and the rules that determine the generated CSS."""
+    payload = json.dumps(
+        [_THEME_HASH_VERSION, _CSS_RULES, theme['colors'], theme.get('color_map', {})],
+        sort_keys=True
+    )
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _swap_colors(css, color_map):
+    """Replace #RRGGBB colors using an old -> new mapping.
+    
+    Colors are matched case-insensitively and only as complete colors, so
+    ``#1A1A1A`` does not touch ``#1A1A1A80``. All colors are swapped in a
+    single scan, so a new color which is also an old color in the mapping
+    is not replaced twice.
+    """
+    if not color_map:
+        return css
+    
+    swaps = {}
+    for old_color, new_color in color_map.items():
+        if not _HEX_COLOR_RE.fullmatch(old_color):
+            raise ValueError(f"color_map key must be a #RRGGBB color: {old_color}")
+        swaps[old_color.lower()] = new_color
+    
+    return _HEX_COLOR_RE.sub(lambda m: swaps.get(m.group().lower(), m.group()), css)
+
+
+def _is_openbench_root(path):
+    """Check if path is OpenBench root directory."""
+    for marker in _OPENBENCH_MARKERS:
+        if not os.path.exists(os.path.join(path, marker)):
+            return False
+    return True
+
+
+@functools.lru_cache(maxsize=8)
+def _find_openbench_root(provided_path, cwd):
+    """Find OpenBench root directory."""
+    if provided_path and os.path.exists(provided_path):
+        return provided_path
+    
+    # Try common locations
+    possible_paths = [
+        cwd,  # Current directory
+        _SCRIPT_DIR,  # Script directory
+        '/home/brandon/OpenBench',
+        '/opt/OpenBench',
+        '/var/www/OpenBench',
+    ]
+    
+    # Look for OpenBench markers (manage.py, OpenBench/static, etc.)
+    for path in possible_paths:
+        if _is_openbench_root(path):
+            return path
+    
+    # If not found, ask user
+    raise ValueError(
+        "Could not find OpenBench root directory. "
+        "Please provide it using --path argument."
+    )
 
 
 class ThemeManager:
     def __init__(self, openbench_root=None):
         """Initialize theme manager with OpenBench root directory."""
-        self.openbench_root = self._find_openbench_root(openbench_root)
+        self.openbench_root = _find_openbench_root(openbench_root, os.getcwd())
         self.static_dir = os.path.join(self.openbench_root, 'OpenBench', 'static')
         self.themes_dir = os.path.join(self.openbench_root, 'themes')
         self.backup_dir = os.path.join(self.openbench_root, 'theme_backups')
+        self.config_path = os.path.join(self.openbench_root, 'OpenBench', 'config.py')
+        self.css_paths = {
+            css_file: os.path.join(self.static_dir, css_file) for css_file in _CSS_FILES
+        }
         
         # Ensure directories exist
         os.makedirs(self.themes_dir, exist_ok=True)
@@ -30,77 +314,52 @@ class ThemeManager:
         print(f"Static files: {self.static_dir}")
         print(f"Themes directory: {self.themes_dir}")
     
-    def _find_openbench_root(self, provided_path=None):
-        """Find OpenBench root directory."""
-        if provided_path and os.path.exists(provided_path):
-            return provided_path
-        
-        # Try common locations
-        possible_paths = [
-            os.getcwd(),  # Current directory
-            os.path.dirname(os.path.abspath(__file__)),  # Script directory
-            '/home/brandon/OpenBench',
-            '/opt/OpenBench',
-            '/var/www/OpenBench',
-        ]
-        
-        # Look for OpenBench markers (manage.py, OpenBench/static, etc.)
-        for path in possible_paths:
-            if self._is_openbench_root(path):
-                return path
-        
-        # If not found, ask user
-        raise ValueError(
-            "Could not find OpenBench root directory. "
-            "Please provide it using --path argument."
-        )
-    
-    def _is_openbench_root(self, path):
-        """Check if path is OpenBench root directory."""
-        markers = [
-            'manage.py',
-            os.path.join('OpenBench', 'static', 'style.css'),
-            os.path.join('Templates', 'OpenBench'),
-        ]
-        return all(os.path.exists(os.path.join(path, marker)) for marker in markers)
-    
     def list_themes(self):
         """List available themes."""
         print("\nAvailable themes:")
-        theme_files = Path(self.themes_dir).glob('theme_*.json')
-        
-        for theme_file in sorted(theme_files):
+        for theme_file in self._scan_themes():
             try:
-                with open(theme_file, 'r') as f:
-                    theme = json.load(f)
-                    name = theme.get('name', 'Unnamed')
-                    desc = theme.get('description', 'No description')
-                    filename = theme_file.name
-                    print(f"  - {filename}: {name}")
-                    print(f"    {desc}")
+                theme = _load_theme(theme_file.path, theme_file.stat().st_mtime_ns)
+                name = theme.get('name', 'Unnamed')
+                desc = theme.get('description', 'No description')
+                filename = theme_file.name
+                print(f"  - {filename}: {name}")
+                print(f"    {desc}")
             except Exception as e:
                 print(f"  - {theme_file.name}: Error reading theme ({e})")
     
+    def _scan_themes(self):
+        """Return theme file entries (theme_*.json), sorted by name."""
+        with os.scandir(self.themes_dir) as entries:
+            themes = [
+                entry for entry in entries
+                if entry.name.startswith('theme_') and entry.name.endswith('.json')
+                and entry.is_file()
+            ]
+        return sorted(themes, key=lambda entry: entry.name)
+    
     def backup_current(self):
         """Backup current CSS files."""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_path = os.path.join(self.backup_dir, f'backup_{timestamp}')
         os.makedirs(backup_path, exist_ok=True)
         
-        css_files = ['style.css', 'form.css', 'paging.css', 'base.css']
-        
+        css_files = [
+            css_file for css_file in _CSS_FILES
+            if os.path.exists(self.css_paths[css_file])
+        ]
+        _copy_files([
+            (self.css_paths[css_file], os.path.join(backup_path, css_file))
+            for css_file in css_files
+        ])
         for css_file in css_files:
-            src = os.path.join(self.static_dir, css_file)
-            if os.path.exists(src):
-                dst = os.path.join(backup_path, css_file)
-                shutil.copy2(src, dst)
-                print(f"  Backed up {css_file}")
+            print(f"  Backed up {css_file}")
         
         print(f"Backup created: {backup_path}")
         return backup_path
     
-    def apply_theme(self, theme_file):
-        """Apply a theme from JSON file."""
+    def _find_theme(self, theme_file):
+        """Locate a theme file, in the themes directory or as given."""
         theme_path = os.path.join(self.themes_dir, theme_file)
         
         if not os.path.exists(theme_path):
@@ -109,87 +368,62 @@ class ThemeManager:
                 theme_path = theme_file
             else:
                 raise FileNotFoundError(f"Theme file not found: {theme_file}")
+        return theme_path
+    
+    def is_applied(self, theme_file):
+        """Check whether style.css already has this theme applied."""
+        theme_path = self._find_theme(theme_file)
+        theme = _load_theme(theme_path, os.stat(theme_path).st_mtime_ns)
+        marker = _THEME_HASH_MARKER.format(_theme_digest(theme))
+        with open(self.css_paths['style.css'], 'r', encoding='utf-8', newline='') as f:
+            return f.read(len(marker)) == marker
+    
+    def apply_theme(self, theme_file):
+        """Apply a theme from JSON file."""
+        theme_path = self._find_theme(theme_file)
         
         print(f"\nApplying theme from: {theme_path}")
         
-        with open(theme_path, 'r') as f:
-            theme = json.load(f)
+        theme = _load_theme(theme_path, os.stat(theme_path).st_mtime_ns)
         
         # Extract theme name for version suffix
         theme_name = os.path.basename(theme_file).replace('theme_', '').replace('.json', '')
         
-        # Read current style.css
-        style_css_path = os.path.join(self.static_dir, 'style.css')
-        with open(style_css_path, 'r') as f:
-            style_content = f.read()
-        
-        # Apply color replacements
-        replacements = []
-        
-        # CSS Variables
-        for var_name, color in theme['colors']['backgrounds'].items():
-            pattern = f'--{var_name}:\\s*#[0-9A-Fa-f]{{6}}'
-            replacement = f'--{var_name}: {color}'
-            replacements.append((pattern, replacement))
+        # Read current style.css, unless this theme is already applied
+        style_css_path = self.css_paths['style.css']
+        marker = _THEME_HASH_MARKER.format(_theme_digest(theme))
+        # No newline translation: the text is scanned and written back as-is
+        with open(style_css_path, 'r', encoding='utf-8', newline='') as f:
+            head = f.read(len(marker))
+            if head == marker:
+                print(f"✓ Theme already applied: {theme.get('name', 'Unknown')}")
+                return
+            style_content = head + f.read()
         
-        for var_name, color in theme['colors']['text'].items():
-            pattern = f'--{var_name}:\\s*#[0-9A-Fa-f]{{6}}'
-            replacement = f'--{var_name}: {color}'
-            replacements.append((pattern, replacement))
+        # Drop the marker left by a previously applied theme
+        if style_content.startswith(_THEME_HASH_PREFIX):
+            style_content = style_content[style_content.find('\n') + 1:]
         
-        # Direct color replacements
-        ui = theme['colors']['ui_elements']
+        colors = theme['colors']
+        css_vars = dict(colors['backgrounds'])
+        css_vars.update(colors['text'])
+        rule_colors = {name: colors[section][key] for name, section, key, _, _ in _CSS_RULES}
         
-        # Fix link colors (match the a: pseudo-class block)
-        replacements.append(
-            (r'(a:link, a:visited, a:hover, a:active\s*\{[^}]*color:\s*)#[0-9A-Fa-f]{6}', 
-             f'\\1{theme["colors"]["links"]["default"]}')
-        )
+        # Literal color swaps, if the theme provides them
+        modified_content = _swap_colors(style_content, theme.get('color_map', {}))
         
-        replacements.extend([
-            # Sidebar hover
-            (r'(#sidebar li:hover\s*\{[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["sidebar_hover"]}'),
-            # Table headers - multiple patterns to catch them all
-            (r'(\.stripes th\s*\{[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["table_header_bg"]}'),
-            (r'(\.table-header th\s*\{[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["table_header_bg"]}'),
-            (r'(\.table-small-header th\s*\{[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["table_header_bg"]}'),
-            (r'(\.table-spacer-small th[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["table_header_bg"]}'),
-            # Table borders
-            (r'(#content td\s*\{[^}]*border-bottom:[^;]*?)#[0-9A-Fa-f]{6}', f'\\1{ui["table_border"]}'),
-            # Hover rows - need to match both odd and even
-            (r'(\.hoverable tr:nth-child\(odd\):hover[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["hover_row"]}'),
-            (r'(\.hoverable tr:nth-child\(even\):hover[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["hover_row"]}'),
-            # Engine options popup
-            (r'(\.engine-options-popup\s*\{[^}]*background-color:\s*)#[0-9A-Fa-f]{6}', f'\\1{ui["popup_bg"]}'),
-            (r'(\.engine-options-popup\s*\{[^}]*border:[^;]*?)#[0-9A-Fa-f]{6}', f'\\1{ui["popup_border"]}'),
-        ])
-        
-        # Button colors
-        buttons = theme['colors']['buttons']
-        for btn_class, color_key in [
-            ('btn-blue', 'btn_blue'),
-            ('btn-start', 'btn_start'),
-            ('btn-preset', 'btn_preset'),
-            ('btn-yellow', 'btn_yellow'),
-            ('btn-red', 'btn_red'),
-        ]:
-            pattern = f'(\\.{btn_class}\\s*{{[^}}]*background-color:\\s*)#[0-9A-Fa-f]{{6}}'
-            replacement = f'\\1{buttons[color_key]}'
-            replacements.append((pattern, replacement))
-            
-            # Hover states
-            pattern = f'(\\.{btn_class}:hover\\s*{{[^}}]*background-color:\\s*)#[0-9A-Fa-f]{{6}}'
-            replacement = f'\\1{buttons[color_key + "_hover"]}'
-            replacements.append((pattern, replacement))
+        # CSS Variables
+        modified_content = _rewrite_root_vars(modified_content, css_vars)
         
-        # Apply replacements
-        modified_content = style_content
-        for pattern, replacement in replacements:
-            modified_content = re.sub(pattern, replacement, modified_content)
+        # Direct color replacements
+        for pattern, selectors in _RULE_PASSES:
+            # Skip the scan if none of this pass's selectors are present
+            if not any(selector in modified_content for selector in selectors):
+                continue
+            modified_content = _replace_rule_colors(modified_content, pattern, rule_colors)
         
         # Write modified CSS
-        with open(style_css_path, 'w') as f:
-            f.write(modified_content)
+        _write_atomic(style_css_path, marker, modified_content)
         
         print(f"✓ Theme applied: {theme.get('name', 'Unknown')}")
         
@@ -198,36 +432,30 @@ class ThemeManager:
     
     def _update_static_version(self, theme_name):
         """Update static version with theme suffix to force browser refresh."""
-        config_path = os.path.join(self.openbench_root, 'OpenBench', 'config.py')
-        
-        if not os.path.exists(config_path):
+        if not os.path.exists(self.config_path):
             print("  Note: config.py not found, skipping version update")
             return
         
-        with open(config_path, 'r') as f:
+        with open(self.config_path, 'r', encoding='utf-8', newline='') as f:
             content = f.read()
         
         # Find current version (could be vX or vX-theme format)
-        match = re.search(r"OPENBENCH_STATIC_VERSION = '([^']+)'", content)
+        match = _STATIC_VERSION_RE.search(content)
         if match:
             old_version = match.group(1)
             
             # Extract base version number if present
-            base_match = re.match(r'v(\d+)', old_version)
-            if base_match:
-                base_version = base_match.group(1)
-            else:
+            base_version = ''
+            if old_version.startswith('v'):
+                base_version = ''.join(itertools.takewhile(str.isdigit, old_version[1:]))
+            if not base_version:
                 base_version = '6'  # Default if can't parse
             
             # Create new version with theme suffix
             new_version = f"v{base_version}-{theme_name}"
             
-            new_content = re.sub(
-                r"OPENBENCH_STATIC_VERSION = '[^']+'",
-                f"OPENBENCH_STATIC_VERSION = '{new_version}'",
-                content
-            )
-            with open(config_path, 'w') as f:
+            new_content = content[:match.start(1)] + new_version + content[match.end(1):]
+            with open(self.config_path, 'w', encoding='utf-8', newline='') as f:
                 f.write(new_content)
             print(f"  ✓ Updated static version: {old_version} → {new_version}")
         else:
@@ -237,11 +465,11 @@ class ThemeManager:
         """Restore a backup."""
         if backup_name == 'latest':
             # Find latest backup
-            backups = sorted(Path(self.backup_dir).iterdir(), key=os.path.getmtime)
+            backups = self._scan_backups()
             if not backups:
                 print("No backups found!")
                 return
-            backup_path = backups[-1]
+            backup_path = backups[-1].path
         else:
             backup_path = os.path.join(self.backup_dir, backup_name)
         
@@ -251,13 +479,16 @@ class ThemeManager:
         
         print(f"Restoring from: {backup_path}")
         
-        css_files = ['style.css', 'form.css', 'paging.css', 'base.css']
+        css_files = [
+            css_file for css_file in _CSS_FILES
+            if os.path.exists(os.path.join(backup_path, css_file))
+        ]
+        _copy_files([
+            (os.path.join(backup_path, css_file), self.css_paths[css_file])
+            for css_file in css_files
+        ])
         for css_file in css_files:
-            src = os.path.join(backup_path, css_file)
-            dst = os.path.join(self.static_dir, css_file)
-            if os.path.exists(src):
-                shutil.copy2(src, dst)
-                print(f"  ✓ Restored {css_file}")
+            print(f"  ✓ Restored {css_file}")
         
         self._update_static_version('restored')
         print("Restore complete!")
@@ -265,17 +496,22 @@ class ThemeManager:
     def list_backups(self):
         """List available backups."""
         print("\nAvailable backups:")
-        backups = sorted(Path(self.backup_dir).iterdir(), key=os.path.getmtime)
+        backups = self._scan_backups()
         
         if not backups:
             print("  No backups found")
             return
         
         for backup in backups:
-            if backup.is_dir():
-                timestamp = backup.name.replace('backup_', '')
-                size = sum(f.stat().st_size for f in backup.glob('*.css'))
-                print(f"  - {backup.name} ({size:,} bytes)")
+            with os.scandir(backup.path) as files:
+                size = sum(f.stat().st_size for f in files if f.name.endswith('.css'))
+            print(f"  - {backup.name} ({size:,} bytes)")
+    
+    def _scan_backups(self):
+        """Return backup directory entries, oldest first."""
+        with os.scandir(self.backup_dir) as entries:
+            backups = [entry for entry in entries if entry.is_dir(follow_symlinks=False)]
+        return sorted(backups, key=lambda entry: entry.stat().st_mtime)
 
 
 def main():
@@ -302,6 +538,9 @@ def main():
         elif args.restore:
             manager.restore_backup(args.restore)
         elif args.apply:
+            if manager.is_applied(args.apply):
+                print(f"\n✓ Theme already applied: {args.apply}")
+                return
             if not args.no_backup:
                 print("Creating backup...")
                 manager.backup_current()